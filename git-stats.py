@@ -3,159 +3,328 @@ import os
 import subprocess
 import argparse
 import re
-import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime
 import yaml
 import sys
+import tempfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def find_git_repos(root_dir):
+# Matches the counts in a --shortstat line, eg "3 files changed, 10 insertions(+), 2 deletions(-)"
+SHORTSTAT_RE = re.compile(r'(\d+) (insertion|deletion)')
+
+# Matches characters that make an author string a regex rather than plain text (besides '.')
+AUTHOR_REGEX_RE = re.compile(r'[\\^$*+?{}\[\]|()]')
+
+def list_subdirs(path):
+    """List the non-hidden subdirectories of a directory, or None if it is a git repository."""
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name == '.git' and entry.is_dir(follow_symlinks=False):
+                    return None
+
+                # And skip hidden directories...
+                if not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+    except OSError:
+        # Unreadable directory, skip it as os.walk would
+        pass
+
+    return subdirs
+
+def walk_git_repos(root_dir):
+    """Serially find git repositories under the given directory."""
+    git_repos = []
+    dirs = [root_dir]
+
+    while dirs:
+        path = dirs.pop()
+        subdirs = list_subdirs(path)
+        if subdirs is None:
+            # Found a repository, don't look any further down
+            git_repos.append(path)
+        else:
+            # Visit the subdirectories in the order they were listed
+            dirs.extend(reversed(subdirs))
+
+    return git_repos
+
+def find_git_repos(root_dir, parallel_depth=3):
     """Recursively find git repositories under the given root directory."""
+    # Listing directories is bound by metadata reads, so the top levels of the tree are scanned in parallel.
+    # Anything deeper than parallel_depth is walked serially by a single worker to keep the tasks worthwhile.
     git_repos = []
+    root_dir = os.path.abspath(root_dir)
+
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        pending = {}
+
+        def submit(path, depth):
+            scan = walk_git_repos if depth == parallel_depth else list_subdirs
+            pending[executor.submit(scan, path)] = (path, depth)
+
+        submit(root_dir, 0)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, depth = pending.pop(future)
+                if depth == parallel_depth:
+                    git_repos.extend(future.result())
+                    continue
 
-    for root, dirs, files in os.walk(root_dir):
-        if '.git' in dirs:
-            git_repos.append(os.path.abspath(root))
-            # Don't parse .git directories
-            dirs.remove('.git')
+                subdirs = future.result()
+                if subdirs is None:
+                    git_repos.append(path)
+                    continue
 
-        # And skip hidden directories...
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
+                for subdir in subdirs:
+                    submit(subdir, depth + 1)
 
-    return git_repos
+    # The scans finish in any order, so sort for a stable result
+    return sorted(git_repos)
 
-def get_git_stats(repo_path, author, exclude_patterns=None, since=None, ignore_commits=None):
-    """Get git stats for a specific repository."""
-    if exclude_patterns is None:
-        exclude_patterns = []
-    if ignore_commits is None:
-        ignore_commits = []
+def aggregate_numstat(added_sums, removed_sums, added_counts, removed_counts, header_ids):
+    """Add parallel arrays of added/removed line counts into the per-header sums, indexed by commit header id."""
+    header_ids = np.frombuffer(header_ids, dtype=np.int64)
+    np.add.at(added_sums, header_ids, np.frombuffer(added_counts, dtype=np.int64))
+    np.add.at(removed_sums, header_ids, np.frombuffer(removed_counts, dtype=np.int64))
 
-    os.chdir(repo_path)
+def read_author_stats(repo_path, authors, exclude_search, since, ignored_changes):
+    """Read the stats for each of the given authors from a single git log of the repository."""
+    # Without exclude patterns or ignored commits there's no need for per-file counts, so let git total up
+    # each commit with --shortstat, which is one line per commit instead of one per file
+    use_shortstat = not exclude_search and not ignored_changes
 
-    # First, process the ignored commits to get a list of files and their changes to exclude
-    ignored_changes = {}
-    for commit_hash in ignore_commits:
-        try:
-            # Get the file changes for this commit
-            ignored_cmd = ['git', 'show', '--numstat', '--pretty=format:', commit_hash]
-            ignored_result = subprocess.run(ignored_cmd, capture_output=True, text=True)
+    # Each commit prints a NUL + 'D' prefixed line with its date and author, which can't be confused with a
+    # stat line and lets us count commits from the same history walk. Passing every author to git (which
+    # matches any of them) means one walk of the repository covers all the authors.
+    cmd = ['git', '-C', repo_path, 'log', *(f'--author={author}' for author in authors),
+           '--shortstat' if use_shortstat else '--numstat', '--format=%x00D%ad%x00%aN <%aE>', '--date=short']
 
-            if ignored_result.returncode != 0:
-                # Probably don't need this warning... since we try to "ignore" commits across all repos
-                print(f"Warning: Could not process ignored commit {commit_hash}. It might not exist in this repository.")
-                continue
+    if since:
+        cmd.append(f'--since={since}')
 
-            ignored_output = ignored_result.stdout.strip()
+    # The per-file (or per-commit) counts are collected into flat arrays along with an id for their commit header
+    # (date and author), and periodically summed into per-header arrays in one vectorised pass. Lines seen before
+    # any header get the None header id.
+    header_ids = {None: 0}
+    commit_counts = [0]
+    added_sums = np.zeros(256, dtype=np.int64)
+    removed_sums = np.zeros(256, dtype=np.int64)
+    added_counts = array('q')
+    removed_counts = array('q')
+    count_header_ids = array('q')
+
+    # Local name lookups are cheaper than globals in the loop below
+    _int = int
+    has_ignored = bool(ignored_changes)
+
+    # Stream the output rather than buffering it, the log of a large repository can run to hundreds of MB. git's
+    # errors go to a temporary file rather than a pipe, so they can't fill up and stall git while we read.
+    current_header_id = 0
+    with tempfile.TemporaryFile() as git_errors, \
+            subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=git_errors, bufsize=-1) as proc:
+        for raw in proc.stdout:
+            line = raw.decode('utf-8', 'replace').rstrip('\n')
+            if line[:2] == '\x00D':
+                # This is a commit header line with the date and author
+                current_header_id = header_ids.setdefault(line[2:], len(header_ids))
+                if current_header_id == len(commit_counts):
+                    commit_counts.append(0)
+                    if current_header_id == len(added_sums):
+                        added_sums = np.concatenate((added_sums, np.zeros_like(added_sums)))
+                        removed_sums = np.concatenate((removed_sums, np.zeros_like(removed_sums)))
+                commit_counts[current_header_id] += 1
+                continue
 
-            for line in ignored_output.split('\n'):
-                if not line.strip():
-                    continue
+            # Skip empty lines
+            if not line:
+                continue
 
-                parts = line.split('\t')
-                if len(parts) != 3:
+            if use_shortstat:
+                # Parse the commit summary line (format: <n> files changed, <added> insertions(+), <removed> deletions(-))
+                added_count = removed_count = 0
+                for count, kind in SHORTSTAT_RE.findall(line):
+                    if kind == 'insertion':
+                        added_count = _int(count)
+                    else:
+                        removed_count = _int(count)
+            else:
+                # Parse stat lines (format: <added> <removed> <file>)
+                parts = line.split('\t', 2)
+                if len(parts) < 3:
                     continue
 
                 added, removed, file_path = parts
 
-                # Skip binary files
-                if added == "-" or removed == "-":
+                # Skip binary files (marked with "-")
+                if added[:1] == '-' or removed[:1] == '-':
                     continue
 
-                # Store these changes to subtract later
-                if file_path not in ignored_changes:
-                    ignored_changes[file_path] = {'added': 0, 'removed': 0}
+                # Check if the file should be excluded
+                if exclude_search and exclude_search(file_path):
+                    continue
 
-                ignored_changes[file_path]['added'] += int(added)
-                ignored_changes[file_path]['removed'] += int(removed)
+                added_count = _int(added)
+                removed_count = _int(removed)
 
-        except Exception as e:
-            print(f"Warning: Error processing ignored commit {commit_hash}: {e}")
+                # Subtract changes from ignored commits for this file
+                if has_ignored and file_path in ignored_changes:
+                    added_count -= ignored_changes[file_path]['added']
+                    removed_count -= ignored_changes[file_path]['removed']
 
-    # Count the total number of commits by this author
-    # Build the git log command for counting commits
-    commit_count_cmd = f"git log --author=\"{author}\" --oneline"
-    if since:
-        commit_count_cmd += f" --since={since}"
+                    # Ensure we don't go negative, although this shouldn't happen
+                    added_count = max(0, added_count)
+                    removed_count = max(0, removed_count)
 
-    try:
-        print(f"  Counting commits using command: {commit_count_cmd}")
-        # Use shell=True to properly handle author names with special characters
-        commit_count_result = subprocess.run(commit_count_cmd, shell=True, capture_output=True, text=True, check=True)
-        commit_lines = commit_count_result.stdout.strip().split('\n') if commit_count_result.stdout.strip() else []
-        commit_count = len(commit_lines)
-        print(f"  Found {commit_count} commits by author '{author}'")
-    except subprocess.CalledProcessError as e:
-        commit_count = 0
-        print(f"  Warning: Error counting commits in {repo_path}: {e}")
-
-    cmd = ['git', 'log', f'--author={author}', '--numstat', '--pretty=format:"%ad"', '--date=short']
+            added_counts.append(added_count)
+            removed_counts.append(removed_count)
+            count_header_ids.append(current_header_id)
 
-    if since:
-        cmd.append(f'--since={since}')
+            # Keep memory bounded on long histories
+            if len(count_header_ids) >= 65536:
+                aggregate_numstat(added_sums, removed_sums, added_counts, removed_counts, count_header_ids)
+                del added_counts[:], removed_counts[:], count_header_ids[:]
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    output = result.stdout
+        # Don't let a broken repository or a bad --since look like an author with no commits
+        if proc.wait() != 0:
+            git_errors.seek(0)
+            raise RuntimeError(f"git log failed: {git_errors.read().decode('utf-8', 'replace').strip()}")
 
-    lines = output.strip().split('\n')
-    stats = {'added': 0, 'removed': 0, 'total': 0, 'commits': commit_count}
-    date_stats = {}
+    aggregate_numstat(added_sums, removed_sums, added_counts, removed_counts, count_header_ids)
 
-    current_date = None
-    for line in lines:
-        if line.startswith('"') and line.endswith('"'):
-            # This is a date line!
-            current_date = line.strip('"')
-            if current_date not in date_stats:
-                date_stats[current_date] = {'added': 0, 'removed': 0, 'total': 0}
-            continue
+    # With one author git has already picked out exactly its commits. With several, get_all_author_stats only
+    # gets here when the authors are plain text, so they can be matched literally against the mailmapped
+    # "Name <email>" that git searched. A '.' matches any character in both git's regex and Python's.
+    if len(authors) == 1:
+        author_patterns = [(authors[0], None)]
+    else:
+        author_patterns = [(author, re.compile(re.escape(author).replace('\\.', '.'))) for author in authors]
 
-        # Skip empty lines
-        if not line:
-            continue
+    all_author_stats = {author: ({'added': 0, 'removed': 0, 'total': 0, 'commits': 0}, {}) for author in authors}
 
-        # Parse stat lines (format: <added> <removed> <file>)
-        parts = line.split('\t')
-        if len(parts) != 3:
+    # Add each header's sums into the overall and date-based stats of every author it matches
+    for header, header_id in header_ids.items():
+        if header is None:
             continue
 
-        added, removed, file_path = parts
+        date, ident = header.split('\x00', 1)
+        added_count = int(added_sums[header_id])
+        removed_count = int(removed_sums[header_id])
+        net = added_count - removed_count
 
-        # Skip binary files (marked with "-")
-        if added == "-" or removed == "-":
-            continue
+        for author, author_re in author_patterns:
+            if author_re and not author_re.search(ident):
+                continue
 
-        # Check if the file should be excluded
-        if any(re.search(pattern, file_path) for pattern in exclude_patterns):
-            continue
+            stats, date_stats = all_author_stats[author]
+            stats['added'] += added_count
+            stats['removed'] += removed_count
+            stats['total'] += net
+            stats['commits'] += commit_counts[header_id]
+
+            if date not in date_stats:
+                date_stats[date] = {'added': 0, 'removed': 0, 'total': 0}
+            date_stats[date]['added'] += added_count
+            date_stats[date]['removed'] += removed_count
+            date_stats[date]['total'] += net
+
+    return all_author_stats
+
+def get_all_author_stats(repo_path, authors, exclude_patterns=None, since=None, ignore_commits=None, warnings=None):
+    """Get git stats for each of the given authors in a specific repository.
+
+    Warnings are added to the warnings list if one is given, so the caller can show them in order, otherwise
+    they're printed straight away.
+    """
+    warn = print if warnings is None else warnings.append
+    if exclude_patterns is None:
+        exclude_patterns = []
+    if ignore_commits is None:
+        ignore_commits = []
+
+    # Combine the exclude patterns into a single regex so each file path is only scanned once. Global flags like
+    # (?i) have to start a regex and can't go in the combined one, so any patterns using them are searched one by one.
+    exclude_res = [re.compile(pattern) for pattern in exclude_patterns]
+    if not exclude_res:
+        exclude_search = None
+    elif all(exclude.flags == re.compile('').flags for exclude in exclude_res):
+        exclude_search = re.compile('|'.join(f'(?:{pattern})' for pattern in exclude_patterns)).search
+    else:
+        exclude_search = lambda file_path: any(exclude.search(file_path) for exclude in exclude_res)
+
+    # First, process the ignored commits to get a list of files and their changes to exclude
+    ignored_changes = {}
+    if ignore_commits:
+        try:
+            # git log fails outright on an unknown commit, so check which ones exist in this repository first
+            check_cmd = ['git', '-C', repo_path, 'cat-file', '--batch-check']
+            check_input = ''.join(f'{commit_hash}^{{commit}}\n' for commit_hash in ignore_commits)
+            check_result = subprocess.run(check_cmd, input=check_input, capture_output=True, text=True)
+
+            # There should be exactly one answer per commit, anything else means cat-file itself went wrong
+            check_lines = check_result.stdout.splitlines()
+            if check_result.returncode != 0 or len(check_lines) != len(ignore_commits):
+                raise RuntimeError(f"git cat-file failed: {check_result.stderr.strip()}")
+
+            found_commits = []
+            for commit_hash, check_line in zip(ignore_commits, check_lines):
+                parts = check_line.split(' ')
+                if len(parts) != 3 or parts[1] != 'commit':
+                    # Probably don't need this warning... since we try to "ignore" commits across all repos
+                    warn(f"Warning: Could not process ignored commit {commit_hash}. It might not exist in this repository.")
+                    continue
+                found_commits.append(parts[0])
+
+            if found_commits:
+                # Get the file changes for all of the commits with a single git log, --cc diffs merges like git show
+                ignored_cmd = ['git', '-C', repo_path, 'log', '--no-walk', '--cc', '--numstat', '--format=', *found_commits]
+                ignored_result = subprocess.run(ignored_cmd, capture_output=True, text=True, check=True)
 
-        added_count = int(added)
-        removed_count = int(removed)
+                for line in ignored_result.stdout.split('\n'):
+                    if not line.strip():
+                        continue
 
-        # Subtract changes from ignored commits for this file
-        if file_path in ignored_changes:
-            added_count -= ignored_changes[file_path]['added']
-            removed_count -= ignored_changes[file_path]['removed']
+                    parts = line.split('\t', 2)
+                    if len(parts) < 3:
+                        continue
 
-            # Ensure we don't go negative, although this shouldn't happen
-            added_count = max(0, added_count)
-            removed_count = max(0, removed_count)
+                    added, removed, file_path = parts
 
-        # Update overall stats
-        stats['added'] += added_count
-        stats['removed'] += removed_count
-        stats['total'] += added_count - removed_count
+                    # Skip binary files
+                    if added == "-" or removed == "-":
+                        continue
+
+                    # Store these changes to subtract later
+                    if file_path not in ignored_changes:
+                        ignored_changes[file_path] = {'added': 0, 'removed': 0}
+
+                    ignored_changes[file_path]['added'] += int(added)
+                    ignored_changes[file_path]['removed'] += int(removed)
+
+        except Exception as e:
+            warn(f"Warning: Error processing ignored commits in {repo_path}: {e}")
 
-        # Update date-based stats if we have a current date
-        if current_date:
-            date_stats[current_date]['added'] += added_count
-            date_stats[current_date]['removed'] += removed_count
-            date_stats[current_date]['total'] += added_count - removed_count
+    # Plain text authors can all be read from one walk of the repository. git matches --author as a basic regex
+    # against the mailmapped identity, which Python's re can't reproduce, so regex authors get a walk each.
+    if len(authors) == 1 or not any(AUTHOR_REGEX_RE.search(author) for author in authors):
+        return read_author_stats(repo_path, authors, exclude_search, since, ignored_changes)
 
-    return stats, date_stats
+    return {author: read_author_stats(repo_path, [author], exclude_search, since, ignored_changes)[author]
+            for author in authors}
 
 def generate_chart(repo_stats, output_file=None, author=None):
     """Generate a chart of repository statistics."""
+    # matplotlib is slow to import, so only load it when a chart is actually drawn. Saving to a file doesn't need
+    # an interactive backend, so use Agg and skip looking for a GUI toolkit.
+    import matplotlib
+    if output_file:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
     # Filter out repos with zero contributions (stuff I might have checked out but didn't contribute to)
     repo_stats = {repo: stats for repo, stats in repo_stats.items()
                  if stats['added'] > 0 or stats['removed'] > 0}
@@ -170,10 +339,8 @@ def generate_chart(repo_stats, output_file=None, author=None):
     removed = [-repo_stats[repo]['removed'] for repo in repo_names]  # Negative on the chart y axis
 
     # Sort repositories by total changes (absolute value of added + removed)
-    sorted_indices = np.argsort([abs(a + r) for a, r in zip(added, removed)])[::-1]
-    repo_names = [repo_names[i] for i in sorted_indices]
-    added = [added[i] for i in sorted_indices]
-    removed = [removed[i] for i in sorted_indices]
+    repo_changes = sorted(zip(repo_names, added, removed), key=lambda change: abs(change[1] + change[2]), reverse=True)
+    repo_names, added, removed = map(list, zip(*repo_changes))
 
     # Calculate totals
     total_added = sum(added)
@@ -300,13 +467,15 @@ def main():
         found_repos = find_git_repos(root_dir)
         print(f"Found {len(found_repos)} git repositories.")
         repos.extend(found_repos)
-        # Remove duplicates while preserving order
-        repos = list(dict.fromkeys(repos))
+
+    # Remove duplicates while preserving order, comparing absolute paths so each repository is only checked once
+    repo_paths = {}
+    for repo_path in repos:
+        repo_paths.setdefault(os.path.abspath(repo_path), repo_path)
 
     # Validate repository paths
     valid_repos = []
-    for repo_path in repos:
-        abs_path = os.path.abspath(repo_path)
+    for abs_path, repo_path in repo_paths.items():
         if not os.path.exists(os.path.join(abs_path, '.git')):
             print(f"Warning: {repo_path} does not appear to be a git repository. Skipping.")
             continue
@@ -318,22 +487,37 @@ def main():
 
     # Process each repository
     all_repos_stats = {}
-    original_dir = os.getcwd()
 
     if ',' in authorStr: 
         authors = [a.strip() for a in authorStr.split(',')]
     else:
         authors = [authorStr.strip()]
 
-    with open(csv_file, 'w') as f:
-        f.write("Author,Repository,Lines Added,Lines Removed,Net Change,Commits\n")
+    # Running git is I/O bound, so run the repositories in parallel and collect the results in order
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, open(csv_file, 'w') as f:
+        # Each repository collects its warnings so they can be shown under it rather than as the threads hit them
+        futures = []
+        for repo_path in valid_repos:
+            repo_warnings = []
+            future = executor.submit(get_all_author_stats, repo_path, authors, exclude_patterns, since, ignore_commits,
+                                     repo_warnings)
+            futures.append((os.path.basename(repo_path), repo_warnings, future))
+
+        # Build up the CSV rows and write them out in one go at the end
+        rows = ["Author,Repository,Lines Added,Lines Removed,Net Change,Commits\n"]
         for author in authors:
-            for repo_path in valid_repos:
-                repo_name = os.path.basename(repo_path)
+            for repo_name, repo_warnings, future in futures:
                 print(f"Processing {repo_name}...")
 
+                # The warnings are only complete once the repository has finished
+                wait([future])
+                for warning in repo_warnings:
+                    print(warning)
+
                 try:
-                    stats, date_stats = get_git_stats(repo_path, author, exclude_patterns, since, ignore_commits)
+                    stats, date_stats = future.result()[author]
+                    print(f"  Found {stats['commits']} commits by author '{author}'")
                     # Only add repositories with actual contributions
                     if stats['added'] > 0 or stats['removed'] > 0:
                         all_repos_stats[repo_name] = stats
@@ -350,34 +534,28 @@ def main():
 
                 except Exception as e:
                     print(f"Error processing {repo_name}: {e}")
-                finally:
-                    os.chdir(original_dir)
 
             if all_repos_stats:
+                # Add the rows and work out the totals in the same pass
+                total_added = total_removed = total_net = total_commits = 0
                 for repo, stats in all_repos_stats.items():
-                    f.write(f"{author},{repo},{stats['added']},{stats['removed']},{stats['total']},{stats   ['commits']}    \n")
-
-                # Add total row
-                total_added = sum(stats['added'] for stats in all_repos_stats.values())
-                total_removed = sum(stats['removed'] for stats in all_repos_stats.values())
-                total_net = sum(stats['total'] for stats in all_repos_stats.values())
-                total_commits = sum(stats['commits'] for stats in all_repos_stats.values())
+                    rows.append(f"{author},{repo},{stats['added']},{stats['removed']},{stats['total']},{stats['commits']}\n")
+                    total_added += stats['added']
+                    total_removed += stats['removed']
+                    total_net += stats['total']
+                    total_commits += stats['commits']
         
         total_change= total_added + total_removed
-        f.write(f"TOTAL,TOTAL ADDED, TOTAL REMOVED, TOTAL NET(added-removed), TOTAL CHANGE(added+removed), TOTALL COMMITS\n")
-        f.write(f"TOTAL,{total_added},{total_removed},{total_net},{total_change},{total_commits}\n")
+        rows.append(f"TOTAL,TOTAL ADDED, TOTAL REMOVED, TOTAL NET(added-removed), TOTAL CHANGE(added+removed), TOTALL COMMITS\n")
+        rows.append(f"TOTAL,{total_added},{total_removed},{total_net},{total_change},{total_commits}\n")
+        f.writelines(rows)
         print(f"CSV export saved to {csv_file}")
 
     # Generate and display/save chart
     if all_repos_stats:
         generate_chart(all_repos_stats, output_file, author)
 
-        # Print overall totals
-        total_added = sum(stats['added'] for stats in all_repos_stats.values())
-        total_removed = sum(stats['removed'] for stats in all_repos_stats.values())
-        total_net = sum(stats['total'] for stats in all_repos_stats.values())
-        total_commits = sum(stats['commits'] for stats in all_repos_stats.values())
-
+        # Print overall totals, these were already worked out for the CSV
         print("Overall Statistics:")
         print(f"Total lines added: {total_added:,}")
         print(f"Total lines removed: {total_removed:,}")
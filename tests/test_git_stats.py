@@ -0,0 +1,125 @@
+import contextlib
+import importlib.util
+import io
+import os
+import subprocess
+import tempfile
+import unittest
+
+# git-stats.py isn't importable by name, so load it from its path
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'git-stats.py')
+spec = importlib.util.spec_from_file_location('git_stats', SCRIPT)
+git_stats = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(git_stats)
+
+
+class GitRepoTestCase(unittest.TestCase):
+    """Runs each test against a fresh, empty git repository."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = self.tmp.name
+        self.env = dict(os.environ, GIT_AUTHOR_NAME='Committer', GIT_AUTHOR_EMAIL='committer@ex.com',
+                        GIT_COMMITTER_NAME='Committer', GIT_COMMITTER_EMAIL='committer@ex.com')
+        self.git('init', '-q', '-b', 'main')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def git(self, *args, env=None):
+        return subprocess.run(['git', '-C', self.repo, *args], check=True, env=env or self.env, capture_output=True,
+                              text=True).stdout.strip()
+
+    def commit(self, name, email, file_name, lines, date):
+        with open(os.path.join(self.repo, file_name), 'w') as f:
+            f.write('line\n' * lines)
+        env = dict(self.env, GIT_AUTHOR_NAME=name, GIT_AUTHOR_EMAIL=email, GIT_AUTHOR_DATE=date,
+                   GIT_COMMITTER_DATE=date)
+        self.git('add', '-A', env=env)
+        self.git('commit', '-q', '-m', file_name, env=env)
+
+
+class AuthorMatchingTest(GitRepoTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Alice commits under her old name, which the .mailmap maps to "Alicia Q"
+        self.commit('Alice Smith', 'alice@ex.com', 'a.txt', 3, '2024-01-01T10:00:00')
+        self.commit('Bob (Jr)', 'bob@ex.com', 'b.txt', 5, '2024-01-02T10:00:00')
+        with open(os.path.join(self.repo, '.mailmap'), 'w') as f:
+            f.write('Alicia Q <alice@ex.com> Alice Smith <alice@ex.com>\n')
+        self.commit('Alice Smith', 'alice@ex.com', 'c.txt', 2, '2024-01-03T10:00:00')
+
+    def stats(self, authors):
+        return git_stats.get_all_author_stats(self.repo, authors)
+
+    def test_author_with_parentheses(self):
+        stats, date_stats = self.stats(['Alicia', 'Bob (Jr)'])['Bob (Jr)']
+        self.assertEqual(stats, {'added': 5, 'removed': 0, 'total': 5, 'commits': 1})
+        self.assertEqual(date_stats, {'2024-01-02': {'added': 5, 'removed': 0, 'total': 5}})
+
+    def test_mailmapped_author(self):
+        expected = {'added': 6, 'removed': 0, 'total': 6, 'commits': 2}
+        self.assertEqual(self.stats(['Alicia'])['Alicia'][0], expected)
+        self.assertEqual(self.stats(['Alicia', 'Bob (Jr)'])['Alicia'][0], expected)
+
+    def test_plain_authors_share_a_walk(self):
+        all_stats = self.stats(['Alicia Q', 'bob@ex.com'])
+        self.assertEqual(all_stats['Alicia Q'][0]['commits'], 2)
+        self.assertEqual(all_stats['bob@ex.com'][0], {'added': 5, 'removed': 0, 'total': 5, 'commits': 1})
+
+
+class IgnoreCommitsTest(GitRepoTestCase):
+    def test_ignored_merge_commit_is_subtracted(self):
+        self.commit('Alice', 'alice@ex.com', 'f.txt', 2, '2024-01-01T10:00:00')
+        self.git('checkout', '-q', '-b', 'side')
+        self.commit('Alice', 'alice@ex.com', 'f.txt', 4, '2024-01-02T10:00:00')
+        self.git('checkout', '-q', 'main')
+        self.commit('Alice', 'alice@ex.com', 'g.txt', 1, '2024-01-03T10:00:00')
+
+        # Merge side, adding two more lines to f.txt in the merge itself (+4 lines compared to main)
+        self.git('merge', '-q', '--no-commit', 'side')
+        self.commit('Alice', 'alice@ex.com', 'f.txt', 6, '2024-01-04T10:00:00')
+        merge = self.git('rev-parse', 'HEAD')
+
+        stats, _ = git_stats.get_all_author_stats(self.repo, ['Alice'], ignore_commits=[merge])['Alice']
+        self.assertEqual(stats, {'added': 1, 'removed': 0, 'total': 1, 'commits': 4})
+
+    def test_missing_commit_warning_is_collected(self):
+        self.commit('Alice', 'alice@ex.com', 'f.txt', 2, '2024-01-01T10:00:00')
+
+        warnings = []
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            git_stats.get_all_author_stats(self.repo, ['Alice'], ignore_commits=['deadbeef'], warnings=warnings)
+        self.assertEqual(output.getvalue(), '')
+        self.assertEqual(warnings, ["Warning: Could not process ignored commit deadbeef. "
+                                    "It might not exist in this repository."])
+
+
+class ExcludePatternsTest(GitRepoTestCase):
+    def test_pattern_with_global_flag(self):
+        self.commit('Alice', 'alice@ex.com', 'T.TXT', 3, '2024-01-01T10:00:00')
+        self.commit('Alice', 'alice@ex.com', 'vendor.txt', 5, '2024-01-02T10:00:00')
+        self.commit('Alice', 'alice@ex.com', 'keep.txt', 2, '2024-01-03T10:00:00')
+
+        stats, _ = git_stats.get_all_author_stats(self.repo, ['Alice'], [r'(?i)t\.txt', '^vendor'])['Alice']
+        self.assertEqual(stats, {'added': 2, 'removed': 0, 'total': 2, 'commits': 3})
+
+
+class GitErrorTest(unittest.TestCase):
+    def test_empty_repository_raises(self):
+        with tempfile.TemporaryDirectory() as repo:
+            subprocess.run(['git', '-C', repo, 'init', '-q'], check=True)
+            with self.assertRaisesRegex(RuntimeError, 'git log failed'):
+                git_stats.get_all_author_stats(repo, ['Alice'])
+
+    def test_failed_commit_check_warns(self):
+        with tempfile.TemporaryDirectory() as not_a_repo:
+            warnings = []
+            with self.assertRaisesRegex(RuntimeError, 'git log failed'):
+                git_stats.get_all_author_stats(not_a_repo, ['Alice'], ignore_commits=['deadbeef'], warnings=warnings)
+            self.assertEqual(len(warnings), 1)
+            self.assertRegex(warnings[0], '^Warning: Error processing ignored commits in .*: git cat-file failed: fatal')
+
+
+if __name__ == '__main__':
+    unittest.main()